@@ -9,17 +9,42 @@ Example usage:
 Inspired by Sean Patrick O'Brien (@obriensp)'s 2013 "proto-dump": https://github.com/obriensp/proto-dump
 """
 
+import mmap
+import os
 from pathlib import Path
 from tqdm import tqdm
-from typing import List, Iterable, BinaryIO, Union, Optional
-from collections import defaultdict
-
-from google.protobuf.internal.decoder import _DecodeVarint, SkipField  # type: ignore
+from typing import (
+    Deque,
+    Dict,
+    List,
+    Iterable,
+    Iterator,
+    BinaryIO,
+    Union,
+    Optional,
+    Set,
+    Tuple,
+)
+from collections import defaultdict, deque
+from collections.abc import Sized
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+
+from google.protobuf.internal.decoder import _DecodeVarint  # type: ignore
 from google.protobuf import descriptor_pb2  # type: ignore
 from google.protobuf.descriptor_pool import DescriptorPool  # type: ignore
 from google.protobuf.message import DecodeError  # type: ignore
 
 
+DESCRIPTOR_PROTO_PATH = "google/protobuf/descriptor.proto"
+
+PROTO_LABELS = {
+    1: "optional",
+    2: "required",
+    3: "repeated",
+}
+
 PROTO_TYPES = {
     1: "double",
     2: "float",
@@ -39,17 +64,130 @@ PROTO_TYPES = {
 }
 
 
-def to_proto_file(fds: descriptor_pb2.FileDescriptorSet) -> str:
+# Indentation for each level of nesting, precomputed for all but the deepest messages:
+_PREFIXES = tuple("  " * i for i in range(32))
+
+
+def indentation(indent: int) -> str:
+    if indent < len(_PREFIXES):
+        return _PREFIXES[indent]
+    return "  " * indent
+
+
+def generate_enum_lines(f, lines: List[str], indent: int = 0):
+    prefix = indentation(indent)
+    write = lines.append
+    for enum in f.enum_type:
+        write(f"{prefix}enum {enum.name} {{")
+        for value in enum.value:
+            write(f"{prefix}  {value.name} = {value.number};")
+        write(f"{prefix}}}")
+
+
+@lru_cache(maxsize=1024)
+def field_line_prefix(
+    label: int, field_type: int, type_name: str, in_oneof: bool
+) -> str:
+    """
+    Return the start of a field's line, up to (and including the space before)
+    its name. Most fields in a descriptor share a handful of label and type
+    combinations, so each prefix is only built once. Message and enum types
+    are keyed by name, so the cache is bounded.
     """
-    Render a Protobuf descriptor_pb2.FileDescriptorSet to a
+    label_name = PROTO_LABELS.get(label)
+    if label_name is None:
+        raise NotImplementedError("Unknown field label type!")
+    # Fields in a oneof are implicitly optional:
+    label_prefix = "" if in_oneof and label == 1 else f"{label_name} "
+
+    type_string = PROTO_TYPES.get(field_type)
+    if type_string is None:
+        if field_type not in (11, 14):  # MESSAGE or ENUM
+            raise NotImplementedError(f"Unknown field type {field_type}!")
+        type_string = type_name
+    return f"  {label_prefix}{type_string} "
+
+
+def generate_field_line(field, in_oneof: bool = False) -> str:
+    prefix = field_line_prefix(field.label, field.type, field.type_name, in_oneof)
+
+    options = [f"default = {field.default_value}"] if field.default_value else []
+    opts = field.options
+    if opts.deprecated:
+        options.append("deprecated = true")
+    if opts.packed:
+        options.append("packed = true")
+    # TODO: Protobuf supports other options in square brackets!
+    # Add support for them here to make this feature-complete.
+    if options:
+        return f"{prefix}{field.name} = {field.number} [{', '.join(options)}];"
+    return f"{prefix}{field.name} = {field.number};"
+
+
+def generate_extension_lines(message, lines: List[str], indent: int = 0):
+    prefix = indentation(indent)
+    write = lines.append
+    extensions_grouped_by_extendee = defaultdict(list)
+    for extension in message.extension:
+        extensions_grouped_by_extendee[extension.extendee].append(extension)
+    for extendee, extensions in extensions_grouped_by_extendee.items():
+        write(f"{prefix}extend {extendee} {{")
+        for extension in extensions:
+            write(f"{prefix}{generate_field_line(extension)}")
+        write(f"{prefix}}}")
+
+
+def generate_message_lines(f, lines: List[str], indent: int = 0):
+    prefix = indentation(indent)
+    next_prefix = indentation(indent + 1)
+    write = lines.append
+
+    submessages = f.message_type if hasattr(f, "message_type") else f.nested_type
+
+    for message in submessages:
+        write(f"{prefix}message {message.name} {{")
+
+        generate_enum_lines(message, lines, indent + 1)
+        generate_message_lines(message, lines, indent + 1)
+
+        oneof_fields = defaultdict(list)
+        for field in message.field:
+            if field.HasField("oneof_index"):
+                oneof_fields[field.oneof_index].append(field)
+            else:
+                write(f"{prefix}{generate_field_line(field)}")
+
+        # ...then the oneofs:
+        for oneof_index, oneof in enumerate(message.oneof_decl):
+            write(f"{next_prefix}oneof {oneof.name} {{")
+            for field in oneof_fields[oneof_index]:
+                write(f"{next_prefix}{generate_field_line(field, in_oneof=True)}")
+            write(f"{next_prefix}}}")
+
+        if len(message.extension_range):
+            if len(message.extension_range) > 1:
+                raise NotImplementedError(
+                    "Not sure how to handle multiple extension ranges!"
+                )
+            start, end = (
+                message.extension_range[0].start,
+                min(message.extension_range[0].end, 536870911),
+            )
+            write(f"{next_prefix}extensions {start} to {end};")
+
+        generate_extension_lines(message, lines, indent + 1)
+        write(f"{prefix}}}")
+        write("")
+
+
+def to_proto_file(f: descriptor_pb2.FileDescriptorProto) -> str:
+    """
+    Render a Protobuf descriptor_pb2.FileDescriptorProto to a
     parseable, human-readable Protobuf string.
 
     Similar to the .DebugString() method in the C++ Protobuf bindings,
     but reimplemented in Python.
     """
-    if len(fds.file) != 1:
-        raise NotImplementedError("Only one file per fds.")
-    f = fds.file[0]
     lines = ['syntax = "proto2";', ""]
 
     for dependency in f.dependency:
@@ -59,104 +197,6 @@ def to_proto_file(fds: descriptor_pb2.FileDescriptorSet) -> str:
         lines.append(f"package {f.package};")
         lines.append("")
 
-    def generate_enum_lines(f, lines: List[str], indent: int = 0):
-        prefix = "  " * indent
-        for enum in f.enum_type:
-            lines.append(prefix + f"enum {enum.name} " + "{")
-            for value in enum.value:
-                lines.append(prefix + f"  {value.name} = {value.number};")
-            lines.append(prefix + "}")
-
-    def generate_field_line(field, in_oneof: bool = False) -> str:
-        line = []
-        if field.label == 1:
-            if not in_oneof:
-                line.append("optional")
-        elif field.label == 2:
-            line.append("required")
-        elif field.label == 3:
-            line.append("repeated")
-        else:
-            raise NotImplementedError("Unknown field label type!")
-
-        if field.type in PROTO_TYPES:
-            line.append(PROTO_TYPES[field.type])
-        elif field.type == 11 or field.type == 14:  # MESSAGE
-            line.append(field.type_name)
-        else:
-            raise NotImplementedError(f"Unknown field type {field.type}!")
-
-        line.append(field.name)
-        line.append("=")
-        line.append(str(field.number))
-        options = []
-        if field.default_value:
-            options.append(f"default = {field.default_value}")
-        if field.options.deprecated:
-            options.append("deprecated = true")
-        if field.options.packed:
-            options.append("packed = true")
-        # TODO: Protobuf supports other options in square brackets!
-        # Add support for them here to make this feature-complete.
-        if options:
-            line.append(f"[{', '.join(options)}]")
-        return f"  {' '.join(line)};"
-
-    def generate_extension_lines(message, lines: List[str], indent: int = 0):
-        prefix = "  " * indent
-        extensions_grouped_by_extendee = defaultdict(list)
-        for extension in message.extension:
-            extensions_grouped_by_extendee[extension.extendee].append(extension)
-        for extendee, extensions in extensions_grouped_by_extendee.items():
-            lines.append(prefix + f"extend {extendee} {{")
-            for extension in extensions:
-                lines.append(prefix + generate_field_line(extension))
-            lines.append(prefix + "}")
-
-    def generate_message_lines(f, lines: List[str], indent: int = 0):
-        prefix = "  " * indent
-
-        submessages = f.message_type if hasattr(f, "message_type") else f.nested_type
-
-        for message in submessages:
-            lines.append(prefix + f"message {message.name} " + "{")
-
-            generate_enum_lines(message, lines, indent + 1)
-            generate_message_lines(message, lines, indent + 1)
-
-            for field in message.field:
-                if not field.HasField("oneof_index"):
-                    lines.append(prefix + generate_field_line(field))
-
-            # ...then the oneofs:
-            next_prefix = "  " * (indent + 1)
-            for oneof_index, oneof in enumerate(message.oneof_decl):
-                lines.append(next_prefix + f"oneof {oneof.name} {{")
-                for field in message.field:
-                    if (
-                        field.HasField("oneof_index")
-                        and field.oneof_index == oneof_index
-                    ):
-                        lines.append(
-                            next_prefix + generate_field_line(field, in_oneof=True)
-                        )
-                lines.append(next_prefix + "}")
-
-            if len(message.extension_range):
-                if len(message.extension_range) > 1:
-                    raise NotImplementedError(
-                        "Not sure how to handle multiple extension ranges!"
-                    )
-                start, end = (
-                    message.extension_range[0].start,
-                    min(message.extension_range[0].end, 536870911),
-                )
-                lines.append(next_prefix + f"extensions {start} to {end};")
-
-            generate_extension_lines(message, lines, indent + 1)
-            lines.append(prefix + "}")
-            lines.append("")
-
     generate_enum_lines(f, lines)
     generate_message_lines(f, lines)
     generate_extension_lines(f, lines)
@@ -164,35 +204,78 @@ def to_proto_file(fds: descriptor_pb2.FileDescriptorSet) -> str:
     return "\n".join(lines)
 
 
+def peek_name(data) -> str:
+    """
+    Read the name (field 1) from the start of a serialized FileDescriptorProto,
+    without parsing the rest of it. protoc serializes fields in order, so the
+    name comes first if it's present at all.
+    """
+    if not len(data):
+        return ""
+    tag, position = _DecodeVarint(data, 0)
+    if tag >> 3 != 1:
+        return ""
+    if tag & 0x7 != 2:
+        raise DecodeError("Unexpected wire type for field 1.")
+    length, position = _DecodeVarint(data, position)
+    if position + length > len(data):
+        raise DecodeError("Truncated message.")
+    return bytes(data[position : position + length]).decode("utf-8")
+
+
 class ProtoFile(object):
     def __init__(self, data, pool):
         self.data = data
+        self._hash = hash(data)
         self.pool = pool
-        self.file_descriptor_proto = descriptor_pb2.FileDescriptorProto.FromString(data)
-        self.path = self.file_descriptor_proto.name
-        self.imports = list(self.file_descriptor_proto.dependency)
-        self.attempt_to_load()
+        self._descriptor = None
+        self._file_descriptor_proto = None
+        self.path = peek_name(data)
 
     @property
     def name(self) -> str:
         return self.path.split("/")[-1]
 
+    @property
+    def file_descriptor_proto(self) -> descriptor_pb2.FileDescriptorProto:
+        # Parsed lazily, as many candidates are thrown away (as duplicates, or
+        # for not being .proto files at all) before we need their contents.
+        if self._file_descriptor_proto is None:
+            self._file_descriptor_proto = descriptor_pb2.FileDescriptorProto.FromString(
+                self.data
+            )
+        return self._file_descriptor_proto
+
+    @property
+    def imports(self) -> List[str]:
+        # Taken from the full parse, as dependencies aren't guaranteed to be
+        # serialized before the file's other fields.
+        return list(self.file_descriptor_proto.dependency)
+
+    def is_parseable(self) -> bool:
+        try:
+            return self.file_descriptor_proto is not None
+        except Exception:
+            return False
+
     def __hash__(self):
-        return hash(self.data)
+        return self._hash
 
     def __eq__(self, other):
         return isinstance(other, ProtoFile) and self.data == other.data
 
     def attempt_to_load(self):
-        # This method will fail if this file is missing dependencies (imports)
+        # This method will fail if this file is missing dependencies (imports).
+        # Once loaded, the descriptor can't change, so only retry on failure;
+        # callers may add this file's imports to the pool later.
+        if self._descriptor is not None:
+            return self._descriptor
         try:
-            return self.pool.Add(self.file_descriptor_proto)
+            self._descriptor = self.pool.Add(self.file_descriptor_proto)
         except Exception as e:
             if "duplicate file name" in str(e):
-                return self.pool.FindFileByName(
-                    e.args[0].split("duplicate file name")[1].strip()
-                )
-            return None
+                self._descriptor = self.pool.FindFileByName(self.path)
+        return self._descriptor
 
     @property
     def descriptor(self):
@@ -204,109 +287,258 @@ class ProtoFile(object):
     @property
     def source(self):
         if self.descriptor:
-            fds = descriptor_pb2.FileDescriptorSet()
-            fds.file.append(descriptor_pb2.FileDescriptorProto())
-            fds.file[0].ParseFromString(self.descriptor.serialized_pb)
-            return to_proto_file(fds)
+            return to_proto_file(self.file_descriptor_proto)
         return None
 
 
-def read_until_null_tag(data):
-    position = 0
-    while position < len(data):
-        try:
-            tag, position = _DecodeVarint(data, position)
-        except Exception:
-            return position
+def read_until_null_tag(data, start: int = 0, end: Optional[int] = None) -> int:
+    """
+    Parse data[start:end] as a protobuf stream until a null tag is found,
+    returning the number of bytes consumed (including the null tag). Parsing
+    also stops just after any tag whose value can't be skipped over, and never
+    consumes more than end - start bytes.
+    """
+    position = start
+    if end is None:
+        end = len(data)
+    while position < end:
+        tag = data[position]
+        if tag < 0x80:
+            # Almost every tag in a descriptor fits in a single byte, so
+            # avoid the overhead of a full varint decode in the common case:
+            position += 1
+        else:
+            try:
+                tag, position = _DecodeVarint(data, position)
+            except Exception:
+                return position - start
+            if position > end:
+                # This tag runs past the end of the range we were asked to parse.
+                return end - start
 
         if tag == 0:
             # Found a null tag, so we're done
-            return position
+            return position - start
+
+        # Skip over this tag's value, based on its wire type:
+        wire_type = tag & 0x7
+        if wire_type == 0:  # varint
+            try:
+                _, new_position = _DecodeVarint(data, position)
+            except Exception:
+                return position - start
+        elif wire_type == 1:  # 64-bit
+            new_position = position + 8
+        elif wire_type == 2:  # length-delimited
+            try:
+                length, new_position = _DecodeVarint(data, position)
+            except Exception:
+                return position - start
+            new_position += length
+        elif wire_type == 5:  # 32-bit
+            new_position = position + 4
+        else:
+            # Groups (3 and 4) never appear in descriptors, and 6 and 7 are invalid.
+            return position - start
 
-        try:
-            new_position = SkipField(data, position, len(data), bytes([tag]))
-        except (AttributeError, DecodeError):
-            return position
-        if new_position == -1:
-            return position
+        if new_position > end:
+            # Truncated value; this can't be part of a descriptor.
+            return position - start
         position = new_position
-    return position
+    return position - start
 
 
-def extract_proto_definitions_from_file(
-    filename_or_file_like: Union[str, Path, BinaryIO],
-    descriptor_pool: DescriptorPool,
-) -> Iterable[ProtoFile]:
+def find_all(haystack, needle: bytes) -> Iterator[int]:
     """
-    Scan a given filename (or path, or binary file-like IO) for protobuf
-    definitions and add all of them to the provided descriptor_pool object,
-    yielding ProtoFile objects as they are found.
+    Yield the offset of every non-overlapping occurrence of needle in haystack,
+    in ascending order. Each byte of haystack is only scanned once.
     """
+    position = haystack.find(needle)
+    while position != -1:
+        yield position
+        position = haystack.find(needle, position + len(needle))
 
+
+def extract_descriptor_data(data: Union[bytes, mmap.mmap]) -> Iterator[bytes]:
+    """
+    Scan a buffer for anything that looks like a serialized FileDescriptorProto,
+    yielding the raw bytes of each candidate. The candidates are not parsed or
+    validated, so this needs no DescriptorPool and can be run in any process.
+    """
+    offset = 0
+
+    PROTO_MARKER = b".proto"
+
+    # Slicing a memoryview doesn't copy, so we can take windows into
+    # (potentially very large) data without allocating a new buffer each time:
+    with memoryview(data) as mv:
+        # Find every ".proto" in a single forward pass over the buffer:
+        for suffix_position in find_all(data, PROTO_MARKER):
+            if suffix_position < offset:
+                # This marker is inside a descriptor we've already extracted.
+                continue
+
+            marker_start = data.rfind(b"\x0A", offset, suffix_position)
+            if marker_start == -1:
+                # Doesn't look like a proto descriptor
+                offset = suffix_position + len(PROTO_MARKER)
+                continue
+
+            try:
+                name_length, new_pos = _DecodeVarint(mv, marker_start)
+            except Exception:
+                # Expected a VarInt here, so if not, continue
+                offset = suffix_position + len(PROTO_MARKER)
+                continue
+
+            # Length = 1 byte for the marker (0x0A) + length of the varint + length of the descriptor name
+            expected_length = 1 + (new_pos - marker_start) + name_length + 7
+            current_length = (suffix_position + len(PROTO_MARKER)) - marker_start
+
+            # Huge margin of error here - my calculations above are probably just wrong.
+            if current_length > expected_length + 30:
+                offset = suffix_position + len(PROTO_MARKER)
+                continue
+
+            # Split the data starting at the marker byte and try to read it as a
+            # protobuf stream. Descriptors are stored as c strings in the .pb.cc files.
+            # They're null-terminated, but can also contain embedded null bytes. Since we
+            # can't search for the null-terminator explicitly, we parse the string manually
+            # until we reach a protobuf tag which equals 0 (identifier = 0, wiretype =
+            # varint), signalling the final null byte of the string. This works because
+            # there are no 0 tags in a real FileDescriptorProto stream.
+            descriptor_length = read_until_null_tag(mv, marker_start) - 1
+            yield bytes(mv[marker_start : marker_start + descriptor_length])
+
+            offset = marker_start + descriptor_length
+
+
+def read_contents(
+    filename_or_file_like: Union[str, Path, BinaryIO],
+) -> Union[bytes, mmap.mmap]:
+    """
+    Return the contents of a given filename (or path, or binary file-like IO)
+    for scanning. Files on disk are memory-mapped rather than read, so that huge
+    binaries don't need to fit in memory; the caller should close the map.
+    """
     if hasattr(filename_or_file_like, "read"):
         data = filename_or_file_like.read()
         if isinstance(data, str):
             # We need bytes:
             data = data.encode("utf-8")
-    else:
-        with open(filename_or_file_like, "rb") as f:
-            data = f.read()
-    offset = 0
+        return data
 
-    PROTO_MARKER = b".proto"
+    with open(filename_or_file_like, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            # Empty files can't be mapped (and can't contain descriptors anyway).
+            return b""
+        # The map holds its own (duplicated) file descriptor, so it outlives f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, "MADV_WILLNEED"):
+        # Have the OS start reading the file in before we start scanning it:
+        data.madvise(mmap.MADV_WILLNEED)
+    return data
 
-    while True:
-        # Look for ".proto"
-        suffix_position = data.find(PROTO_MARKER, offset)
-        if suffix_position == -1:
-            break
 
-        marker_start = data.rfind(b"\x0A", offset, suffix_position)
-        if marker_start == -1:
-            # Doesn't look like a proto descriptor
-            offset = suffix_position + len(PROTO_MARKER)
-            continue
+def scan_contents(data: Union[bytes, mmap.mmap]) -> List[bytes]:
+    """
+    Return the raw bytes of each candidate descriptor in data (as returned by
+    read_contents). The candidates are copies, so remain valid once data is
+    unmapped, which this function does when it's done.
+    """
+    try:
+        return list(extract_descriptor_data(data))
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
 
+
+def extract_descriptor_data_from_file(
+    filename_or_file_like: Union[str, Path, BinaryIO],
+) -> List[bytes]:
+    """
+    Scan a given filename (or path, or binary file-like IO) for protobuf
+    definitions, returning the raw bytes of each candidate descriptor.
+    """
+    return scan_contents(read_contents(filename_or_file_like))
+
+
+def parse_proto_files(
+    descriptor_data: Iterable[bytes],
+    descriptor_pool: DescriptorPool,
+    seen: Optional[Set[bytes]] = None,
+) -> Iterable[ProtoFile]:
+    """
+    Parse candidate descriptors (as returned by extract_descriptor_data) into
+    ProtoFile objects backed by the given descriptor_pool, skipping any that
+    don't parse. The returned files are not added to the descriptor_pool; see
+    load_in_dependency_order.
+
+    If a set is passed as seen, candidates already in it are skipped, and
+    new candidates are added to it.
+    """
+    for data in descriptor_data:
+        if seen is not None:
+            # The same descriptor is often embedded in many binaries (e.g.: in
+            # shared frameworks), so don't bother parsing it more than once:
+            if data in seen:
+                continue
+            seen.add(data)
         try:
-            name_length, new_pos = _DecodeVarint(data, marker_start)
-        except Exception:
-            # Expected a VarInt here, so if not, continue
-            offset = suffix_position + len(PROTO_MARKER)
-            continue
-
-        # Length = 1 byte for the marker (0x0A) + length of the varint + length of the descriptor name
-        expected_length = 1 + (new_pos - marker_start) + name_length + 7
-        current_length = (suffix_position + len(PROTO_MARKER)) - marker_start
-
-        # Huge margin of error here - my calculations above are probably just wrong.
-        if current_length > expected_length + 30:
-            offset = suffix_position + len(PROTO_MARKER)
-            continue
-
-        # Split the data starting at the marker byte and try to read it as a
-        # protobuf stream. Descriptors are stored as c strings in the .pb.cc files.
-        # They're null-terminated, but can also contain embedded null bytes. Since we
-        # can't search for the null-terminator explicitly, we parse the string manually
-        # until we reach a protobuf tag which equals 0 (identifier = 0, wiretype =
-        # varint), signalling the final null byte of the string. This works because
-        # there are no 0 tags in a real FileDescriptorProto stream.
-        descriptor_length = read_until_null_tag(data[marker_start:]) - 1
-        descriptor_data = data[marker_start : marker_start + descriptor_length]
-        try:
-            proto_file = ProtoFile(descriptor_data, descriptor_pool)
-            if (
-                proto_file.path.endswith(".proto")
-                and proto_file.path != "google/protobuf/descriptor.proto"
-            ):
+            proto_file = ProtoFile(data, descriptor_pool)
+            if proto_file.path.endswith(".proto"):
                 yield proto_file
         except Exception:
             pass
 
-        offset = marker_start + descriptor_length
 
+def extract_proto_definitions_from_file(
+    filename_or_file_like: Union[str, Path, BinaryIO],
+    descriptor_pool: DescriptorPool,
+    seen: Optional[Set[bytes]] = None,
+) -> Iterable[ProtoFile]:
+    """
+    Scan a given filename (or path, or binary file-like IO) for protobuf
+    definitions and add all of them to the provided descriptor_pool object,
+    yielding ProtoFile objects as they are found. Pass the same seen set to
+    multiple calls to skip descriptors that were found in earlier files.
+    """
+    for proto_file in parse_proto_files(
+        extract_descriptor_data_from_file(filename_or_file_like),
+        descriptor_pool,
+        seen,
+    ):
+        if proto_file.is_parseable():
+            proto_file.attempt_to_load()
+            if proto_file.path != DESCRIPTOR_PROTO_PATH:
+                yield proto_file
+
+
+def group_by_path(all_files: Iterable[ProtoFile]) -> Dict[str, List[ProtoFile]]:
+    by_path: Dict[str, List[ProtoFile]] = defaultdict(list)
+    for f in all_files:
+        by_path[f.path].append(f)
+    return by_path
 
-def find_missing_dependencies(all_files, source_file):
-    matches = [f for f in all_files if f.path == source_file]
+
+def find_missing_dependencies(
+    all_files,
+    source_file,
+    by_path: Optional[Dict[str, List[ProtoFile]]] = None,
+    visited: Optional[Set[str]] = None,
+):
+    if by_path is None:
+        by_path = group_by_path(all_files)
+    if visited is None:
+        visited = set()
+
+    # Each path only needs to be walked once; any missing dependencies
+    # below it have already been reported by the first visit.
+    if source_file in visited:
+        return set()
+    visited.add(source_file)
+
+    matches = by_path.get(source_file)
     if not matches:
         return {source_file}
 
@@ -317,14 +549,79 @@ def find_missing_dependencies(all_files, source_file):
 
     to_return = set()
     for dep in missing:
-        to_return.update(find_missing_dependencies(all_files, dep))
+        to_return.update(find_missing_dependencies(all_files, dep, by_path, visited))
 
     return to_return
 
 
+def collect_all_missing(all_files):
+    """
+    Return the paths of all dependencies that are required (directly or
+    transitively) by any unloadable file in all_files, but are not present.
+    """
+    by_path = group_by_path(all_files)
+    visited: Set[str] = set()
+    missing = set()
+    for found in all_files:
+        if not found.attempt_to_load():
+            missing.update(
+                find_missing_dependencies(all_files, found.path, by_path, visited)
+            )
+    return missing
+
+
+def sort_by_dependencies(all_files: Iterable[ProtoFile]) -> List[ProtoFile]:
+    """
+    Order the given files such that each file comes after all of the files it
+    imports (where those are present), using Kahn's algorithm. Files that
+    are part of an import cycle can't be ordered, and are placed at the end.
+    """
+    by_path = group_by_path(all_files)
+    dependents: Dict[str, List[str]] = defaultdict(list)
+    remaining_imports: Dict[str, int] = {}
+    for path, files in by_path.items():
+        # Files with the same path should be identical (or near enough), so
+        # only the imports found in *any* of them are waited on.
+        imports = {imp for f in files for imp in f.imports if imp in by_path}
+        remaining_imports[path] = len(imports)
+        for imp in imports:
+            dependents[imp].append(path)
+
+    ready = deque(
+        sorted(path for path, count in remaining_imports.items() if not count)
+    )
+    ordered = []
+    while ready:
+        path = ready.popleft()
+        ordered.extend(by_path[path])
+        for dependent in dependents[path]:
+            remaining_imports[dependent] -= 1
+            if not remaining_imports[dependent]:
+                ready.append(dependent)
+
+    for path in sorted(path for path, count in remaining_imports.items() if count):
+        ordered.extend(by_path[path])
+    return ordered
+
+
+def load_in_dependency_order(all_files: Iterable[ProtoFile]):
+    """
+    Add each of the given files to its DescriptorPool, making sure that
+    every file's imports are added before it is.
+    """
+    for proto_file in sort_by_dependencies(all_files):
+        proto_file.attempt_to_load()
+
+
 def main(argv: Optional[list[str]] = None):
     import argparse
 
+    def positive_int(value: str) -> int:
+        number = int(value)
+        if number < 1:
+            raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+        return number
+
     parser = argparse.ArgumentParser(
         description=(
             "Read all files in a given directory and scan each file for protobuf definitions,"
@@ -337,17 +634,20 @@ def main(argv: Optional[list[str]] = None):
     parser.add_argument(
         "output_path", help="Output directory to dump .protoc files to."
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        default=None,
+        help="Number of processes to scan files with. Defaults to one per CPU.",
+    )
 
     args = parser.parse_args(argv or None)
 
-    all_filenames = [
-        str(path) for path in Path(args.input_path).rglob("*") if not path.is_dir()
-    ]
-
-    print(
-        f"Scanning {len(all_filenames):,} files under {args.input_path} for protobuf definitions..."
+    print(f"Scanning files under {args.input_path} for protobuf definitions...")
+    proto_files = detect_all_proto_files_from_paths(
+        walk_files(args.input_path), args.jobs
     )
-    proto_files = detect_all_proto_files_from_paths(all_filenames)
     for proto_file in tqdm(proto_files):
         Path(args.output_path).mkdir(parents=True, exist_ok=True)
         with open(Path(args.output_path) / proto_file.name, "w") as f:
@@ -359,32 +659,153 @@ def main(argv: Optional[list[str]] = None):
     print(f"Done! Wrote {len(proto_files):,} proto files to {args.output_path}.")
 
 
+def walk_files(root: Union[str, Path]) -> Iterator[str]:
+    """
+    Yield the path of every file under root (or just root, if it's a file),
+    lazily, so that scanning can start before the whole tree has been listed.
+    """
+    if os.path.isfile(root):
+        yield str(root)
+        return
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            yield os.path.join(dirpath, filename)
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        # Respect any CPU affinity we've been given (e.g.: by taskset or a container):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def read_ahead(
+    files: Iterable[Union[str, Path, BinaryIO]],
+) -> Iterator[Union[bytes, mmap.mmap]]:
+    """
+    Yield the contents of each file (as returned by read_contents), in order.
+    Files are opened and mapped a few at a time on background threads, so that
+    slow disks (or network filesystems) don't hold up whatever consumes them.
+    """
+    workers = available_cpus()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: Deque[Future] = deque()
+        for f in files:
+            pending.append(executor.submit(read_contents, f))
+            if len(pending) > 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# The number of files on disk each worker process scans at once.
+SCAN_CHUNK_SIZE = 16
+
+
+# The candidate descriptors that this (worker) process has already returned.
+_already_returned: Set[bytes] = set()
+
+
+def reset_already_returned():
+    _already_returned.clear()
+
+
+def scan_file_chunk(paths: List[Union[str, Path]]) -> List[List[bytes]]:
+    """
+    Scan each of the given files for candidate descriptors in a worker process.
+    Any candidate this worker has already returned is left out, as the main
+    process would only discard it, and sending it back isn't free.
+    """
+    results = []
+    for path in paths:
+        candidates = [
+            candidate
+            for candidate in extract_descriptor_data_from_file(path)
+            if candidate not in _already_returned
+        ]
+        _already_returned.update(candidates)
+        results.append(candidates)
+    return results
+
+
+def scan_files(
+    files: Iterable[Union[str, Path, BinaryIO]], jobs: Optional[int] = None
+) -> Iterator[List[bytes]]:
+    """
+    Scan each of the given files for candidate descriptors, yielding a list of
+    raw descriptor bytes per file (in no particular order). Files on disk are
+    scanned in parallel across `jobs` processes (defaulting to one per CPU);
+    file-like objects are scanned in this process, as they can't be shared with
+    worker processes. files is consumed lazily, and may be a generator.
+    """
+    if jobs is not None and jobs < 1:
+        raise ValueError(f"jobs must be at least 1, not {jobs}.")
+    if jobs == 1:
+        yield from map(scan_contents, read_ahead(files))
+        return
+
+    # Keep a bounded number of chunks queued up for the workers, rather than
+    # consuming all of files before any results come back. (When jobs is None,
+    # ProcessPoolExecutor picks its own worker count, which is capped on Windows.)
+    max_pending = 2 * (jobs or available_cpus())
+    with ExitStack() as stack:
+        executor = None
+        pending: Deque[Future] = deque()
+        chunk = []
+        for f in files:
+            if hasattr(f, "read"):
+                yield extract_descriptor_data_from_file(f)
+                continue
+
+            chunk.append(f)
+            if len(chunk) < SCAN_CHUNK_SIZE:
+                continue
+            if executor is None:
+                executor = stack.enter_context(
+                    ProcessPoolExecutor(
+                        max_workers=jobs, initializer=reset_already_returned
+                    )
+                )
+            pending.append(executor.submit(scan_file_chunk, chunk))
+            chunk = []
+            while len(pending) > max_pending:
+                yield from pending.popleft().result()
+
+        if executor is None:
+            # Too few files to be worth starting up worker processes for:
+            yield from map(scan_contents, read_ahead(chunk))
+        elif chunk:
+            pending.append(executor.submit(scan_file_chunk, chunk))
+        while pending:
+            yield from pending.popleft().result()
+
+
 def detect_all_proto_files_from_paths(
     files: Iterable[Union[str, Path, BinaryIO]],
+    jobs: Optional[int] = None,
 ) -> set[ProtoFile]:
     GLOBAL_DESCRIPTOR_POOL = DescriptorPool()
-    # Do this entire thing twice, as the order of the found descriptors
-    # may not match the order of the flattened dependency tree:
-    proto_files_found = set()
-    for _ in range(2):
-        for path in tqdm(files):
-            for proto in extract_proto_definitions_from_file(
-                path, GLOBAL_DESCRIPTOR_POOL
-            ):
-                proto_files_found.add(proto)
-
-        missing_deps = set()
-        for found in proto_files_found:
-            if not found.attempt_to_load():
-                missing_deps.update(
-                    find_missing_dependencies(proto_files_found, found.path)
-                )
+    proto_files_found: Set[ProtoFile] = set()
+    seen: Set[bytes] = set()
+    # DescriptorPool can't be shared between processes, so only the raw byte
+    # scanning is done in parallel; all descriptors are loaded in this process.
+    total = len(files) if isinstance(files, Sized) else None
+    for descriptor_data in tqdm(scan_files(files, jobs), total=total):
+        proto_files_found.update(
+            parse_proto_files(descriptor_data, GLOBAL_DESCRIPTOR_POOL, seen)
+        )
+
+    # Candidates are only fully parsed once we know they're worth keeping:
+    proto_files_found = {f for f in proto_files_found if f.is_parseable()}
+
+    # The order of the found descriptors may not match the order of the
+    # flattened dependency tree, so add them to the pool in dependency order:
+    load_in_dependency_order(proto_files_found)
 
-        for found in proto_files_found:
-            if not found.attempt_to_load():
-                missing_deps.add(found)
-        if not missing_deps:
-            return proto_files_found
+    missing_deps = collect_all_missing(proto_files_found)
+    for found in proto_files_found:
+        if not found.attempt_to_load():
+            missing_deps.add(found)
 
     if missing_deps:
         raise ValueError(
@@ -392,7 +813,9 @@ def detect_all_proto_files_from_paths(
             f"proto file{'' if len(missing_deps) == 1 else 's'} could"
             f" not be found:\n{missing_deps}"
         )
-    return proto_files_found
+    # descriptor.proto is needed to load anything that imports it, but is part
+    # of Protobuf itself, so isn't worth outputting:
+    return {f for f in proto_files_found if f.path != DESCRIPTOR_PROTO_PATH}
 
 
 if __name__ == "__main__":
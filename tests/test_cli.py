@@ -1,11 +1,27 @@
 import os
 import pytest
 
+from google.protobuf import descriptor_pb2
+from google.protobuf.descriptor_pool import DescriptorPool
+
 from io import BytesIO
-from typing import List
+from typing import List, Set, Tuple
 from pathlib import Path
 
-from protodump.cli import detect_all_proto_files_from_paths, main
+from protodump import cli
+from protodump.cli import (
+    SCAN_CHUNK_SIZE,
+    ProtoFile,
+    detect_all_proto_files_from_paths,
+    extract_proto_definitions_from_file,
+    find_all,
+    main,
+    read_until_null_tag,
+    scan_files,
+    sort_by_dependencies,
+    to_proto_file,
+    walk_files,
+)
 
 
 @pytest.mark.parametrize(
@@ -90,3 +106,265 @@ def test_parser_extracts_names(
     out_path = tmpdir / "output"
     main([str(tmpdir), str(out_path)])
     assert len(list(os.listdir(str(out_path)))) == len(file_contents)
+
+
+def test_read_until_null_tag_handles_multi_byte_tags():
+    # Field 40, wire type 2 (length-delimited) needs a two-byte tag:
+    data = b"\xc2\x02\x01x\x00trailing garbage"
+    assert read_until_null_tag(data) == 5
+    assert read_until_null_tag(memoryview(b"xyz" + data), start=3) == 5
+
+
+def test_read_until_null_tag_stops_at_end():
+    # The end falls inside a two-byte tag:
+    assert read_until_null_tag(b"\x80\x01\x00", 0, 1) == 1
+    assert read_until_null_tag(b"xy\xc2\x02\x01x\x00", 2, 3) == 1
+    # The end falls inside a varint value and a length-delimited value:
+    assert read_until_null_tag(b"\x08\x96\x01\x00", 0, 2) == 1
+    assert read_until_null_tag(b"\x0a\x01x\x00", 0, 2) == 1
+
+
+def test_read_until_null_tag_skips_varint_fields():
+    # Field 1, wire type 0 (varint) with a two-byte value of 150:
+    assert read_until_null_tag(memoryview(b"\x08\x96\x01\x00garbage")) == 4
+    assert read_until_null_tag(b"\x08\x96\x01\x00garbage") == 4
+
+
+def test_read_until_null_tag_skips_fixed_width_fields():
+    # Field 1 as a fixed64 (wire type 1), then field 2 as a fixed32 (wire type 5):
+    data = b"\x09" + b"\xff" * 8 + b"\x15" + b"\xff" * 4 + b"\x00garbage"
+    assert read_until_null_tag(data) == 15
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"\x0b\x00",  # Start of a group
+        b"\x0f\x00",  # Invalid wire type 7
+        b"\x0a\x05abc",  # Truncated length-delimited field
+        b"\x09\x00\x00",  # Truncated fixed64
+    ],
+)
+def test_read_until_null_tag_stops_after_unskippable_tags(data: bytes):
+    assert read_until_null_tag(data) == 1
+
+
+def test_find_all_returns_every_marker():
+    data = b"a.proto\x00b.proto.proto"
+    assert list(find_all(data, b".proto")) == [1, 9, 15]
+    assert list(find_all(b"nothing here", b".proto")) == []
+
+
+def embed_descriptor(name: str, dependencies: Tuple[str, ...] = ()) -> bytes:
+    descriptor = descriptor_pb2.FileDescriptorProto(name=name, dependency=dependencies)
+    descriptor.message_type.add(name=name.split(".")[0].title())
+    return b"\x01\x02garbage" + descriptor.SerializeToString() + b"\x00garbage"
+
+
+def test_dependencies_are_resolved_regardless_of_order():
+    files = [
+        BytesIO(embed_descriptor("a.proto", ("b.proto",))),
+        BytesIO(embed_descriptor("b.proto", ("c.proto",))),
+        BytesIO(embed_descriptor("c.proto")),
+    ]
+    proto_files = detect_all_proto_files_from_paths(files)
+    assert {f.name for f in proto_files} == {"a.proto", "b.proto", "c.proto"}
+    assert all(f.source for f in proto_files)
+
+
+def test_dependencies_serialized_after_other_fields_are_resolved():
+    # Concatenated messages merge, so this puts a.proto's dependency after its
+    # message_type, rather than in field order as protoc would:
+    a = descriptor_pb2.FileDescriptorProto(name="a.proto")
+    a.message_type.add(name="A")
+    data = (
+        a.SerializeToString()
+        + descriptor_pb2.FileDescriptorProto(dependency=["b.proto"]).SerializeToString()
+    )
+    files = [
+        BytesIO(b"\x01\x02garbage" + data + b"\x00garbage"),
+        BytesIO(embed_descriptor("b.proto")),
+    ]
+    proto_files = detect_all_proto_files_from_paths(files)
+    assert {f.name for f in proto_files} == {"a.proto", "b.proto"}
+    assert all(f.source for f in proto_files)
+    (a_file,) = (f for f in proto_files if f.name == "a.proto")
+    assert a_file.imports == ["b.proto"]
+
+
+def test_missing_dependencies_are_reported():
+    files = [
+        BytesIO(embed_descriptor("a.proto", ("b.proto",))),
+        BytesIO(embed_descriptor("b.proto", ("missing.proto",))),
+    ]
+    with pytest.raises(ValueError, match="missing.proto"):
+        detect_all_proto_files_from_paths(files)
+
+
+def test_duplicate_candidates_are_only_parsed_once(monkeypatch):
+    parsed = []
+
+    class CountingProtoFile(ProtoFile):
+        def __init__(self, data, pool):
+            parsed.append(data)
+            super().__init__(data, pool)
+
+    monkeypatch.setattr(cli, "ProtoFile", CountingProtoFile)
+
+    pool = DescriptorPool()
+    seen: Set[bytes] = set()
+    data = embed_descriptor("a.proto")
+    first = list(extract_proto_definitions_from_file(BytesIO(data), pool, seen))
+    second = list(extract_proto_definitions_from_file(BytesIO(data), pool, seen))
+    assert [f.name for f in first] == ["a.proto"]
+    assert second == []
+    assert len(parsed) == 1
+
+
+def test_shared_pool_loads_files_found_before_their_imports():
+    pool = DescriptorPool()
+    seen: Set[bytes] = set()
+    (a,) = extract_proto_definitions_from_file(
+        BytesIO(embed_descriptor("a.proto", ("b.proto",))), pool, seen
+    )
+    assert a.source is None
+    (b,) = extract_proto_definitions_from_file(
+        BytesIO(embed_descriptor("b.proto")), pool, seen
+    )
+    assert b.source
+    assert a.source
+
+
+def test_unparseable_candidates_are_skipped():
+    # A valid name, followed by a message_type field full of garbage:
+    unparseable = b"\n\tbad.proto\x22\x05\xff\xff\xff\xff\xff\x00"
+    files = [BytesIO(embed_descriptor("a.proto") + unparseable)]
+    proto_files = detect_all_proto_files_from_paths(files)
+    assert {f.name for f in proto_files} == {"a.proto"}
+
+
+def test_descriptor_proto_is_loaded_but_not_output():
+    descriptor_proto = descriptor_pb2.DESCRIPTOR.serialized_pb
+    files = [
+        BytesIO(embed_descriptor("a.proto", ("google/protobuf/descriptor.proto",))),
+        BytesIO(b"garbage" + descriptor_proto + b"\x00garbage"),
+    ]
+    proto_files = detect_all_proto_files_from_paths(files)
+    assert {f.name for f in proto_files} == {"a.proto"}
+
+
+def test_sort_by_dependencies_puts_imports_first():
+    pool = DescriptorPool()
+    files = [
+        ProtoFile(
+            descriptor_pb2.FileDescriptorProto(
+                name=name, dependency=dependencies
+            ).SerializeToString(),
+            pool,
+        )
+        for name, dependencies in [
+            ("cycle_a.proto", ["cycle_b.proto"]),
+            ("a.proto", ["b.proto", "unknown.proto"]),
+            ("b.proto", ["c.proto"]),
+            ("cycle_b.proto", ["cycle_a.proto"]),
+            ("c.proto", []),
+        ]
+    ]
+    assert [f.path for f in sort_by_dependencies(files)] == [
+        "c.proto",
+        "b.proto",
+        "a.proto",
+        "cycle_a.proto",
+        "cycle_b.proto",
+    ]
+
+
+def write_scannable_files(tmpdir: Path):
+    for name, dependencies in [("a.proto", ("b.proto",)), ("b.proto", ())]:
+        tmpdir.join(f"{name}.bin").write(embed_descriptor(name, dependencies))
+    tmpdir.join("empty.bin").write(b"")
+    # Enough files to be worth handing off to worker processes, many of which
+    # contain the same descriptor:
+    for i in range(SCAN_CHUNK_SIZE * 4):
+        tmpdir.mkdir(f"dir_{i}").join("shared.bin").write(
+            b"garbage.proto" * i + embed_descriptor("b.proto")
+        )
+
+
+def test_files_on_disk_are_scanned_serially(tmpdir: Path):
+    write_scannable_files(tmpdir)
+    proto_files = detect_all_proto_files_from_paths(walk_files(tmpdir), jobs=1)
+    assert {f.name for f in proto_files} == {"a.proto", "b.proto"}
+
+
+def test_files_on_disk_are_scanned_in_parallel(tmpdir: Path):
+    write_scannable_files(tmpdir)
+    # Run twice, to make sure that no state leaks between runs:
+    for _ in range(2):
+        proto_files = detect_all_proto_files_from_paths(walk_files(tmpdir), jobs=2)
+        assert {f.name for f in proto_files} == {"a.proto", "b.proto"}
+
+
+@pytest.mark.parametrize("jobs", ["0", "-1"])
+def test_main_rejects_non_positive_jobs(jobs: str, tmpdir: Path):
+    with pytest.raises(SystemExit):
+        main([str(tmpdir), str(tmpdir / "output"), "--jobs", jobs])
+
+
+def test_scan_files_rejects_non_positive_jobs():
+    with pytest.raises(ValueError, match="jobs"):
+        list(scan_files([BytesIO(b"")], jobs=0))
+
+
+def test_main_accepts_a_single_file(tmpdir: Path):
+    tmpdir.join("input.bin").write(embed_descriptor("a.proto"))
+    main([str(tmpdir.join("input.bin")), str(tmpdir / "output")])
+    assert os.listdir(str(tmpdir / "output")) == ["a.proto"]
+
+
+def test_to_proto_file_renders_nested_messages():
+    f = descriptor_pb2.FileDescriptorProto(name="nested.proto", package="pkg")
+    outer = f.message_type.add(name="Outer")
+    kind = outer.enum_type.add(name="Kind")
+    kind.value.add(name="KIND_A", number=0)
+    kind.value.add(name="KIND_B", number=1)
+    inner = outer.nested_type.add(name="Inner")
+    inner.field.add(name="value", number=1, label=1, type=9, default_value="hello")
+    deep = inner.nested_type.add(name="Deep")
+    deep.field.add(name="flags", number=1, label=3, type=13).options.packed = True
+    outer.oneof_decl.add(name="choice")
+    outer.field.add(
+        name="inner", number=1, label=1, type=11, type_name=".pkg.Outer.Inner"
+    ).oneof_index = 0
+    outer.field.add(
+        name="kind", number=2, label=1, type=14, type_name=".pkg.Outer.Kind"
+    ).oneof_index = 0
+    outer.field.add(name="plain", number=3, label=1, type=3).options.deprecated = True
+
+    assert (
+        to_proto_file(f)
+        == """syntax = "proto2";
+
+package pkg;
+
+message Outer {
+  enum Kind {
+    KIND_A = 0;
+    KIND_B = 1;
+  }
+  message Inner {
+    message Deep {
+      repeated uint32 flags = 1 [packed = true];
+    }
+
+    optional string value = 1 [default = hello];
+  }
+
+  optional int64 plain = 3 [deprecated = true];
+  oneof choice {
+    .pkg.Outer.Inner inner = 1;
+    .pkg.Outer.Kind kind = 2;
+  }
+}
+"""
+    )